@@ -19,11 +19,19 @@
 # SOFTWARE.
 
 import argparse
-import inspect
+import mmap
 import os
 import os.path
+import re
 import shutil
 import sys
+from functools import lru_cache
+from importlib import import_module
+
+@lru_cache(maxsize=None)
+def _lazy(name):
+    """Import module `name` (relative to this package) on first use."""
+    return import_module(name, __package__)
 
 # Pipelines
 # =========
@@ -34,12 +42,23 @@ def read_plain(_, fpath, fname):
     with open(fpath, encoding="utf-8") as f:
         return f.read()
 
+MMAP_THRESHOLD = 64 * 1024
+"""Size above which ``read_bytes`` maps files into memory instead of reading them."""
+
+def read_bytes(_, fpath, fname):
+    if fname == "-":
+        return sys.stdin.buffer.read()
+    with open(fpath, mode="rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
 def read_json(_, fpath, fname):
-    from json import load
+    from .json import loads
     if fname == "-":
-        return load(sys.stdin)
-    with open(fpath, encoding="utf-8") as f:
-        return load(f)
+        return loads(sys.stdin.buffer.read())
+    with open(fpath, mode="rb") as f:
+        return loads(f.read())
 
 def parse_coq_plain(contents):
     return [contents]
@@ -59,27 +78,61 @@ def rst_to_coq(coq, fpath, point, marker):
     from .literate import rst2coq_marked
     return _catch_parsing_errors(fpath, rst2coq_marked, coq, point, marker)
 
-def annotate_chunks(chunks, fpath, cache_directory, sertop_args):
-    from .core import SerAPI, annotate
-    from .json import Cache
+def annotate_chunks(chunks, fpath, cache_directory, content_cache_directory,
+                    sertop_args, prover_workers):
+    from .core import SerAPI
+    from .json import Cache, ContentCache
+    from .parallel import (annotate_pooled, annotate_in_parallel,
+                           PROVER_WORKERS_THRESHOLD)
+    generator = SerAPI.version_info()
+
+    def annotate_uncached(chunks):
+        if prover_workers > 1 and len(chunks) >= PROVER_WORKERS_THRESHOLD:
+            return annotate_in_parallel(chunks, sertop_args, prover_workers)
+        return annotate_pooled(chunks, sertop_args)
+
+    def annotate(chunks):
+        if content_cache_directory is None:
+            return annotate_uncached(chunks)
+        # Include the generator so that upgrading Coq invalidates entries
+        metadata = {"sertop_args": sertop_args, "generator": generator}
+        shared = ContentCache(content_cache_directory, metadata)
+        return shared.update(chunks, annotate_uncached, generator)
+
     cache = Cache(cache_directory, fpath, sertop_args)
-    return cache.update(chunks, lambda c: annotate(c, sertop_args), SerAPI.version_info())
+    return cache.update(chunks, annotate, generator)
 
 def register_docutils(v, sertop_args):
     from .docutils import setup, AlectryonTransform
+    from .parallel import annotate_pooled
     AlectryonTransform.SERTOP_ARGS = sertop_args
+    # Reuse SerAPI instances across documents, as for Coq inputs
+    AlectryonTransform.ANNOTATE = staticmethod(annotate_pooled)
     setup()
     return v
 
+@lru_cache(maxsize=None)
+def _docutils_writer(Writer):
+    """Return a shared instance of `Writer`.
+
+    Docutils writers are reset by each call to ``write``, so a single instance
+    can be reused for all documents of a run.
+    """
+    return Writer()
+
 def _gen_docutils(source, fpath,
                   include_banner, include_vernums,
                   traceback, Parser, Reader, Writer,
                   settings_overrides):
-    from docutils.core import publish_string
+    publish_string = _lazy("docutils.core").publish_string
 
-    # The encoding/decoding dance below happens because setting output_encoding
-    # to "unicode" causes reST to generate a bad <meta> tag, and setting
-    # input_encoding to "unicode" breaks the ‘.. include’ directive.
+    # `source` is passed as bytes (see ``read_bytes``; the ``coq+rst`` frontend
+    # reads text, which translates line endings) and the output is decoded
+    # because setting output_encoding to "unicode" causes reST to generate a
+    # bad <meta> tag, and setting input_encoding to "unicode" breaks the
+    # ‘.. include’ directive.
+    if isinstance(source, str):
+        source = source.encode("utf-8")
 
     settings_overrides = {
         'traceback': traceback,
@@ -93,15 +146,19 @@ def _gen_docutils(source, fpath,
     }
 
     parser = Parser()
-    return publish_string(
-        source=source.encode("utf-8"),
-        source_path=fpath, destination_path=None,
-        reader=Reader(parser), reader_name=None,
-        parser=parser, parser_name=None,
-        writer=Writer(), writer_name=None,
-        settings=None, settings_spec=None,
-        settings_overrides=settings_overrides, config_section=None,
-        enable_exit_status=True).decode("utf-8")
+    try:
+        return publish_string(
+            source=source,
+            source_path=fpath, destination_path=None,
+            reader=Reader(parser), reader_name=None,
+            parser=parser, parser_name=None,
+            writer=_docutils_writer(Writer), writer_name=None,
+            settings=None, settings_spec=None,
+            settings_overrides=settings_overrides, config_section=None,
+            enable_exit_status=True).decode("utf-8")
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
 
 def gen_docutils(src, frontend, backend, fpath,
                  webpage_style, include_banner, include_vernums,
@@ -179,24 +236,27 @@ def lint_rst(rst, fpath, traceback):
     from docutils.parsers.rst import Parser
     return _lint_docutils(rst, fpath, Parser, traceback)
 
+SCRUB_FNAME_RE = re.compile("[^-a-zA-Z0-9]")
+
+@lru_cache(maxsize=512)
 def _scrub_fname(fname):
-    import re
-    return re.sub("[^-a-zA-Z0-9]", "-", fname)
+    return SCRUB_FNAME_RE.sub("-", fname)
 
-def apply_transforms(annotated):
-    from .transforms import default_transform
-    for chunk in annotated:
-        yield default_transform(chunk)
+# Transforms are applied lazily, one chunk at a time, as snippets are generated.
 
 def gen_html_snippets(annotated, fname):
-    from .html import HtmlGenerator
-    from .pygments import highlight_html
-    return HtmlGenerator(highlight_html, _scrub_fname(fname)).gen(annotated)
+    HtmlGenerator = _lazy(".html").HtmlGenerator
+    highlight_html = _lazy(".pygments").highlight_html
+    default_transform = _lazy(".transforms").default_transform
+    writer = HtmlGenerator(highlight_html, _scrub_fname(fname))
+    return writer.gen(map(default_transform, annotated))
 
 def gen_latex_snippets(annotated):
-    from .latex import LatexGenerator
-    from .pygments import highlight_latex
-    return LatexGenerator(highlight_latex).gen(annotated)
+    LatexGenerator = _lazy(".latex").LatexGenerator
+    highlight_latex = _lazy(".pygments").highlight_latex
+    default_transform = _lazy(".transforms").default_transform
+    writer = LatexGenerator(highlight_latex)
+    return writer.gen(map(default_transform, annotated))
 
 COQDOC_OPTIONS = ['--body-only', '--no-glob', '--no-index', '--no-externals',
                   '-s', '--html', '--stdout', '--utf8']
@@ -207,12 +267,13 @@ def _run_coqdoc(coq_snippets, coqdoc_bin=None):
     from tempfile import mkstemp, mkdtemp
     from subprocess import check_output
     coqdoc_bin = coqdoc_bin or os.path.join(os.getenv("COQBIN", ""), "coqdoc")
+    # Separators prevent fusing snippets
+    contents = b"".join(snippet.encode("utf-8") + b"\n(* --- *)\n"
+                        for snippet in coq_snippets)
     dpath = mkdtemp(prefix="alectryon_coqdoc_")
     fd, filename = mkstemp(prefix="alectryon_coqdoc_", suffix=".v", dir=dpath)
     try:
-        for snippet in coq_snippets:
-            os.write(fd, snippet.encode("utf-8"))
-            os.write(fd, b"\n(* --- *)\n") # Separator to prevent fusing
+        os.write(fd, contents)
         os.close(fd)
         coqdoc = [coqdoc_bin, *COQDOC_OPTIONS, "-d", dpath, filename]
         return check_output(coqdoc, cwd=dpath, timeout=10).decode("utf-8")
@@ -220,7 +281,7 @@ def _run_coqdoc(coq_snippets, coqdoc_bin=None):
         rmtree(dpath)
 
 def _gen_coqdoc_html(coqdoc_fragments):
-    from bs4 import BeautifulSoup
+    BeautifulSoup = _lazy("bs4").BeautifulSoup
     coqdoc_output = _run_coqdoc(fr.contents for fr in coqdoc_fragments)
     soup = BeautifulSoup(coqdoc_output, "html.parser")
     docs = soup.find_all(class_='doc')
@@ -274,40 +335,49 @@ def copy_assets(state, assets, copy_fn, output_directory):
             copy_fn(src, dst)
         except shutil.SameFileError:
             pass
+        except FileExistsError:
+            pass # Another worker process linked the same asset concurrently
 
     return state
 
+@lru_cache(maxsize=1)
+def _standalone_html_head():
+    """Render the ``<head>`` contents shared by all standalone documents."""
+    tags, raw = _lazy("dominate.tags"), _lazy("dominate.util").raw
+    GENERATOR = _lazy(".").GENERATOR
+    HTML_FORMATTER = _lazy(".pygments").HTML_FORMATTER
+    html = _lazy(".html")
+    ASSETS, ADDITIONAL_HEADS = html.ASSETS, html.ADDITIONAL_HEADS
+
+    head = [tags.meta(charset="utf-8"),
+            tags.meta(name="generator", content=GENERATOR)]
+    head.extend(raw(hd) for hd in ADDITIONAL_HEADS)
+    head.extend(tags.link(rel="stylesheet", href=css) for css in ASSETS.ALECTRYON_CSS)
+    head.extend(raw(link) for link in (ASSETS.IBM_PLEX_CDN, ASSETS.FIRA_CODE_CDN))
+    head.extend(tags.script(src=js) for js in ASSETS.ALECTRYON_JS)
+
+    pygments_css = HTML_FORMATTER.get_style_defs('.highlight')
+    head.append(tags.style(pygments_css, type="text/css"))
+
+    return "".join(node.render(pretty=False) for node in head)
+
 def dump_html_standalone(snippets, fname, webpage_style,
                          include_banner, include_vernums,
                          assets, html_classes):
-    from dominate import tags, document
-    from dominate.util import raw
-    from . import GENERATOR
-    from .core import SerAPI
-    from .pygments import HTML_FORMATTER
-    from .html import ASSETS, ADDITIONAL_HEADS, gen_banner, wrap_classes
+    tags, document = _lazy("dominate.tags"), _lazy("dominate").document
+    raw = _lazy("dominate.util").raw
+    SerAPI = _lazy(".core").SerAPI
+    html = _lazy(".html")
+    ASSETS = html.ASSETS
+    gen_banner, wrap_classes = html.gen_banner, html.wrap_classes
 
     doc = document(title=fname)
     doc.set_attribute("class", "alectryon-standalone")
-
-    doc.head.add(tags.meta(charset="utf-8"))
-    doc.head.add(tags.meta(name="generator", content=GENERATOR))
-
-    for hd in ADDITIONAL_HEADS:
-        doc.head.add(raw(hd))
-    for css in ASSETS.ALECTRYON_CSS:
-        doc.head.add(tags.link(rel="stylesheet", href=css))
-    for link in (ASSETS.IBM_PLEX_CDN, ASSETS.FIRA_CODE_CDN):
-        doc.head.add(raw(link))
-    for js in ASSETS.ALECTRYON_JS:
-        doc.head.add(tags.script(src=js))
+    doc.head.add(raw(_standalone_html_head()))
 
     assets.extend(ASSETS.ALECTRYON_CSS)
     assets.extend(ASSETS.ALECTRYON_JS)
 
-    pygments_css = HTML_FORMATTER.get_style_defs('.highlight')
-    doc.head.add(tags.style(pygments_css, type="text/css"))
-
     cls = wrap_classes(webpage_style, *html_classes)
     root = doc.body.add(tags.article(cls=cls))
     if include_banner:
@@ -326,39 +396,37 @@ def dump_json(js):
     return dumps(js, indent=4)
 
 def dump_html_snippets(snippets):
-    s = ""
     for snippet in snippets:
-        s += snippet.render(pretty=True)
-        s += "<!-- alectryon-block-end -->\n"
-    return s
+        yield snippet.render(pretty=True)
+        yield "<!-- alectryon-block-end -->\n"
 
 def dump_latex_snippets(snippets):
-    s = ""
     for snippet in snippets:
-        s += str(snippet)
-        s += "\n%% alectryon-block-end\n"
-    return s
+        yield str(snippet)
+        yield "\n%% alectryon-block-end\n"
 
+@lru_cache(maxsize=None)
 def strip_extension(fname):
-    for ext in EXTENSIONS:
-        if fname.endswith(ext):
-            return fname[:-len(ext)]
-    return fname
+    ext = lookup_extension(fname, EXTENSIONS_INDEX)
+    return fname[:-len(ext)] if ext else fname
 
 def write_output(ext, contents, fname, output, output_directory):
+    """Write `contents` (a string or an iterable of strings) to `output`."""
+    if isinstance(contents, str):
+        contents = (contents,)
     if output == "-" or (output is None and fname == "-"):
-        sys.stdout.write(contents)
+        sys.stdout.writelines(contents)
     else:
         if not output:
             output = os.path.join(output_directory, strip_extension(fname) + ext)
         with open(output, mode="w", encoding="utf-8") as f:
-            f.write(contents)
+            f.writelines(contents)
 
 def write_file(ext):
     return lambda contents, fname, output, output_directory: \
         write_output(ext, contents, fname, output, output_directory)
 
-# No ‘apply_transforms’ in JSON pipelines: (we save the prover output without
+# No transforms in JSON pipelines: (we save the prover output without
 # modifications).
 PIPELINES = {
     'json': {
@@ -366,25 +434,24 @@ PIPELINES = {
         (read_json, annotate_chunks,
          prepare_json, dump_json, write_file(".io.json")),
         'snippets-html':
-        (read_json, annotate_chunks, apply_transforms, gen_html_snippets,
+        (read_json, annotate_chunks, gen_html_snippets,
          dump_html_snippets, write_file(".snippets.html")),
         'snippets-latex':
-        (read_json, annotate_chunks, apply_transforms, gen_latex_snippets,
+        (read_json, annotate_chunks, gen_latex_snippets,
          dump_latex_snippets, write_file(".snippets.tex"))
     },
     'coq': {
         'null':
         (read_plain, parse_coq_plain, annotate_chunks),
         'webpage':
-        (read_plain, parse_coq_plain, annotate_chunks, apply_transforms,
-         gen_html_snippets, dump_html_standalone, copy_assets,
-         write_file(".v.html")),
+        (read_plain, parse_coq_plain, annotate_chunks, gen_html_snippets,
+         dump_html_standalone, copy_assets, write_file(".v.html")),
         'snippets-html':
-        (read_plain, parse_coq_plain, annotate_chunks, apply_transforms,
-         gen_html_snippets, dump_html_snippets, write_file(".snippets.html")),
+        (read_plain, parse_coq_plain, annotate_chunks, gen_html_snippets,
+         dump_html_snippets, write_file(".snippets.html")),
         'snippets-latex':
-        (read_plain, parse_coq_plain, annotate_chunks, apply_transforms,
-         gen_latex_snippets, dump_latex_snippets, write_file(".snippets.tex")),
+        (read_plain, parse_coq_plain, annotate_chunks, gen_latex_snippets,
+         dump_latex_snippets, write_file(".snippets.tex")),
         'lint':
         (read_plain, register_docutils, lint_rstcoq,
          write_file(".lint.json")),
@@ -415,10 +482,10 @@ PIPELINES = {
     },
     'rst': {
         'webpage':
-        (read_plain, register_docutils, gen_docutils, copy_assets,
+        (read_bytes, register_docutils, gen_docutils, copy_assets,
          write_file(".html")),
         'latex':
-        (read_plain, register_docutils, gen_docutils, copy_assets,
+        (read_bytes, register_docutils, gen_docutils, copy_assets,
          write_file(".tex")),
         'lint':
         (read_plain, register_docutils, lint_rst,
@@ -449,6 +516,27 @@ BACKENDS_BY_EXTENSION = [
     ('.v.tex', 'latex'), ('.tex', 'latex')
 ]
 
+def index_extensions(table):
+    """Index `table`, a list of ``(ext, value)`` pairs, by last extension.
+
+    Within each bucket, longer extensions come first, so that looking up
+    ``a.lint.json`` finds ``.lint.json`` before ``.json``.
+    """
+    index = {}
+    for ext, value in sorted(table, key=lambda p: -len(p[0])):
+        index.setdefault(ext.rpartition(".")[2], []).append((ext, value))
+    return index
+
+def lookup_extension(fpath, index, default=None):
+    for ext, value in index.get(fpath.rpartition(".")[2], ()):
+        if fpath.endswith(ext):
+            return value
+    return default
+
+EXTENSIONS_INDEX = index_extensions((ext, ext) for ext in EXTENSIONS)
+FRONTENDS_INDEX = index_extensions(FRONTENDS_BY_EXTENSION)
+BACKENDS_INDEX = index_extensions(BACKENDS_BY_EXTENSION)
+
 DEFAULT_BACKENDS = {
     'json': 'json',
     'coq': 'webpage',
@@ -457,20 +545,20 @@ DEFAULT_BACKENDS = {
     'rst': 'webpage'
 }
 
-def infer_mode(fpath, kind, arg, table):
-    for (ext, mode) in table:
-        if fpath.endswith(ext):
-            return mode
+def infer_mode(fpath, kind, arg, index):
+    mode = lookup_extension(fpath, index)
+    if mode:
+        return mode
     MSG = """{}: Not sure what to do with {!r}.
 Try passing {}?"""
     raise argparse.ArgumentTypeError(MSG.format(kind, fpath, arg))
 
 def infer_frontend(fpath):
-    return infer_mode(fpath, "input", "--frontend", FRONTENDS_BY_EXTENSION)
+    return infer_mode(fpath, "input", "--frontend", FRONTENDS_INDEX)
 
 def infer_backend(frontend, out_fpath):
     if out_fpath:
-        return infer_mode(out_fpath, "output", "--backend", BACKENDS_BY_EXTENSION)
+        return infer_mode(out_fpath, "output", "--backend", BACKENDS_INDEX)
     return DEFAULT_BACKENDS[frontend]
 
 def resolve_pipeline(fpath, args):
@@ -488,8 +576,27 @@ expecting one of {}"""
 
     return supported_backends[backend]
 
+def _sendfile_copy(src, dst):
+    """Copy `src` to `dst` in kernel space using ``os.sendfile``.
+
+    Fall back to ``shutil.copyfileobj`` on platforms or file systems that do
+    not support ``sendfile`` between regular files.
+    """
+    with open(src, mode="rb") as fsrc, open(dst, mode="wb") as fdst:
+        try:
+            size = os.fstat(fsrc.fileno()).st_size
+            while os.sendfile(fdst.fileno(), fsrc.fileno(), None, size) > 0:
+                pass
+        except (AttributeError, OSError):
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copymode(src, dst)
+
 COPY_FUNCTIONS = {
     "copy": shutil.copy,
+    "sendfile": _sendfile_copy,
     "symlink": os.symlink,
     "hardlink": os.link,
     "none": None
@@ -502,23 +609,19 @@ def post_process_arguments(parser, args):
     if args.stdin_filename and "-" not in args.input:
         parser.error("argument --stdin-filename: input must be '-'")
 
-    for dirpath in args.coq_args_I:
-        args.sertop_args.extend(("-I", dirpath))
-    for pair in args.coq_args_R:
-        args.sertop_args.extend(("-R", ",".join(pair)))
-    for pair in args.coq_args_Q:
-        args.sertop_args.extend(("-Q", ",".join(pair)))
+    if args.jobs < 1:
+        parser.error("argument --jobs: Expecting a positive number")
+
+    if args.prover_workers < 1:
+        parser.error("argument --prover-workers: Expecting a positive number")
+
+    # Keep the order in which these flags have always been passed to SerAPI
+    args.sertop_args.extend((*args.coq_args_I, *args.coq_args_R, *args.coq_args_Q))
 
     # argparse applies ‘type’ before ‘choices’, so we do the conversion here
     args.copy_fn = COPY_FUNCTIONS[args.copy_fn]
 
     args.point, args.marker = args.mark_point
-    if args.point is not None:
-        try:
-            args.point = int(args.point)
-        except ValueError:
-            MSG = "argument --mark-point: Expecting a number, not {!r}"
-            parser.error(MSG.format(args.point))
 
     args.assets = []
     args.html_classes = []
@@ -527,6 +630,28 @@ def post_process_arguments(parser, args):
 
     return args
 
+class _AppendSertopArgs(argparse.Action):
+    """Append `flag` followed by the comma-separated values to `dest`."""
+    def __init__(self, option_strings, dest, flag, **kwargs):
+        super().__init__(option_strings, dest, **kwargs)
+        self.flag = flag
+
+    def __call__(self, _parser, namespace, values, _option_string=None):
+        sertop_args = list(getattr(namespace, self.dest) or ())
+        sertop_args.extend((self.flag, ",".join(values)))
+        setattr(namespace, self.dest, sertop_args)
+
+class _MarkPointAction(argparse.Action):
+    """Parse ``POINT MARKER`` into an ``(int, str)`` pair."""
+    def __call__(self, _parser, namespace, values, _option_string=None):
+        point, marker = values
+        try:
+            point = int(point)
+        except ValueError:
+            MSG = "Expecting a number, not {!r}"
+            raise argparse.ArgumentError(self, MSG.format(point)) from None
+        setattr(namespace, self.dest, (point, marker))
+
 def build_parser():
     parser = argparse.ArgumentParser(description="""\
 Annotate segments of Coq code with responses and goals.
@@ -576,10 +701,22 @@ and produce reStructuredText, HTML, or JSON output.""")
                         default="copy", dest="copy_fn",
                         help=COPY_ASSETS_HELP)
 
+    JOBS_HELP = "Process up to JOBS input files in parallel."
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="JOBS",
+                        help=JOBS_HELP)
+
     CACHE_DIRECTORY_HELP = ("Cache Coq's output in DIRECTORY.")
     parser.add_argument("--cache-directory", default=None, metavar="DIRECTORY",
                         help=CACHE_DIRECTORY_HELP)
 
+    CONTENT_CACHE_DIRECTORY_HELP = ("Also cache Coq's output in DIRECTORY, "
+                                    "indexed by contents, to share it across "
+                                    "identical inputs.  Unlike --cache-directory, "
+                                    "DIRECTORY holds opaque files that are not "
+                                    "meant to be checked in.")
+    parser.add_argument("--content-cache-directory", default=None,
+                        metavar="DIRECTORY", help=CONTENT_CACHE_DIRECTORY_HELP)
+
     NO_HEADER_HELP = "Do not insert a header with usage instructions in webpages."
     parser.add_argument("--no-header", action='store_false',
                         dest="include_banner", default="True",
@@ -598,7 +735,7 @@ and produce reStructuredText, HTML, or JSON output.""")
 
     MARK_POINT_HELP = "Mark a point in the output with a given marker."
     parser.add_argument("--mark-point", nargs=2, default=(None, None),
-                        metavar=("POINT", "MARKER"),
+                        metavar=("POINT", "MARKER"), action=_MarkPointAction,
                         help=MARK_POINT_HELP)
 
 
@@ -613,18 +750,26 @@ and produce reStructuredText, HTML, or JSON output.""")
 
     I_HELP = "Pass -I DIR to the SerAPI subprocess."
     subp.add_argument("-I", "--ml-include-path", dest="coq_args_I",
-                      metavar="DIR", nargs=1, action="append",
-                      default=[], help=I_HELP)
+                      metavar="DIR", nargs=1, action=_AppendSertopArgs,
+                      default=[], flag="-I", help=I_HELP)
 
     Q_HELP = "Pass -Q DIR COQDIR to the SerAPI subprocess."
     subp.add_argument("-Q", "--load-path", dest="coq_args_Q",
-                      metavar=("DIR", "COQDIR"), nargs=2, action="append",
-                      default=[], help=Q_HELP)
+                      metavar=("DIR", "COQDIR"), nargs=2, action=_AppendSertopArgs,
+                      default=[], flag="-Q", help=Q_HELP)
 
     R_HELP = "Pass -R DIR COQDIR to the SerAPI subprocess."
     subp.add_argument("-R", "--rec-load-path", dest="coq_args_R",
-                      metavar=("DIR", "COQDIR"), nargs=2, action="append",
-                      default=[], help=R_HELP)
+                      metavar=("DIR", "COQDIR"), nargs=2, action=_AppendSertopArgs,
+                      default=[], flag="-R", help=R_HELP)
+
+    PROVER_WORKERS_HELP = ("Annotate JSON inputs with many fragments in up "
+                           "to WORKERS SerAPI processes.  Each process first "
+                           "re-executes all preceding fragments, so this "
+                           "trades CPU time for latency.  Other inputs always "
+                           "use a single SerAPI process.")
+    subp.add_argument("--prover-workers", type=int, default=1,
+                      metavar="WORKERS", help=PROVER_WORKERS_HELP)
 
     EXPECT_UNEXPECTED_HELP = "Ignore unexpected output from SerAPI"
     parser.add_argument("--expect-unexpected", action="store_true",
@@ -648,23 +793,49 @@ def parse_arguments():
 # Entry point
 # ===========
 
-def call_pipeline_step(step, state, ctx):
-    params = list(inspect.signature(step).parameters.keys())[1:]
-    return step(state, **{p: ctx[p] for p in params})
-
-def build_context(fpath, args):
+@lru_cache(maxsize=None)
+def _step_params(step):
+    """Return the names of the parameters of `step`, except the first one.
+
+    All pipeline steps are plain functions with positional parameters, so we
+    read them from the code object instead of using ``inspect.signature``.
+    """
+    code = step.__code__
+    return code.co_varnames[1:code.co_argcount]
+
+NEEDED_PARAMS = frozenset(
+    p for pipelines in PIPELINES.values() for pipeline in pipelines.values()
+    for step in pipeline
+    for p in _step_params(step))
+"""Names of all parameters used by pipeline steps."""
+
+def _compile_steps(steps):
+    """Combine `steps` into a single function of a state and a context."""
+    plan = [(step, _step_params(step)) for step in steps]
+    def run(state, ctx):
+        for step, params in plan:
+            state = step(state, *[ctx[p] for p in params])
+        return state
+    return run
+
+def build_context(fpath, args, cwd):
     if fpath == "-":
         fname, fpath = "-", (args.stdin_filename or "-")
     else:
         fname = os.path.basename(fpath)
 
-    ctx = {"fpath": fpath, "fname": fname, **vars(args)}
+    ctx = {k: getattr(args, k) for k in NEEDED_PARAMS if hasattr(args, k)}
+    ctx["fpath"], ctx["fname"] = fpath, fname
+    # Steps add to html_classes; don't let these changes leak to other inputs
+    ctx["html_classes"] = list(ctx["html_classes"])
 
     if args.output_directory is None:
         if fname == "-":
             ctx["output_directory"] = "."
         else:
-            ctx["output_directory"] = os.path.dirname(os.path.abspath(fpath))
+            # Same as ``abspath``, without a ``getcwd`` call per input
+            abspath = os.path.normpath(os.path.join(cwd, fpath))
+            ctx["output_directory"] = os.path.dirname(abspath)
 
     return ctx
 
@@ -673,28 +844,83 @@ def except_hook(etype, value, tb):
     for line in TracebackException(etype, value, tb, capture_locals=True).format():
         print(line, file=sys.stderr)
 
-def process_pipelines(args):
-    if args.debug:
+def init_globals(debug, traceback, cache_directory, expect_unexpected):
+    if debug:
         from . import core
         core.DEBUG = True
 
-    if args.traceback:
+    if traceback:
         from . import core
         core.TRACEBACK = True
         sys.excepthook = except_hook
 
-    if args.cache_directory:
+    if cache_directory:
         from . import docutils
-        docutils.CACHE_DIRECTORY = args.cache_directory
+        docutils.CACHE_DIRECTORY = cache_directory
 
-    if args.expect_unexpected:
+    if expect_unexpected:
         from . import core
         core.SerAPI.EXPECT_UNEXPECTED = True
 
-    for fpath, pipeline in args.pipelines:
-        state, ctx = None, build_context(fpath, args)
-        for step in pipeline:
-            state = call_pipeline_step(step, state, ctx)
+@lru_cache(maxsize=None)
+def _compile_pipeline(pipeline):
+    return _compile_steps(pipeline)
+
+def _run_compiled_pipeline(run, ctxs):
+    for ctx in ctxs:
+        run(None, ctx)
+
+READ_STEPS = (read_plain, read_bytes, read_json)
+
+def _process_pipeline_with_io_threads(ctxs, pipeline):
+    """Like ``process_pipeline``, but overlap reads with processing.
+
+    While input N is being processed, input N + 1 is read in a separate
+    thread.  Outputs are still written (and streamed) as soon as they are
+    produced, so write errors are reported right away.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .parallel import prefetching_read
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        steps = list(pipeline)
+        if steps[0] in READ_STEPS:
+            steps[0] = prefetching_read(steps[0], ctxs, reader)
+        # Don't memoize: the wrapper above is specific to this call
+        _run_compiled_pipeline(_compile_steps(steps), ctxs)
+
+def process_pipeline(fpaths, pipeline, args):
+    cwd = os.getcwd()
+    ctxs = [build_context(fpath, args, cwd) for fpath in fpaths]
+    if len(ctxs) > 1:
+        _process_pipeline_with_io_threads(ctxs, pipeline)
+    else:
+        _run_compiled_pipeline(_compile_pipeline(pipeline), ctxs)
+
+def _process_pipeline_in_worker(fpath, args):
+    # Pipelines contain closures (``write_file``), which can't be pickled, so
+    # workers resolve them again from the frontend and backend.
+    process_pipeline([fpath], PIPELINES[args.frontend][args.backend], args)
+
+def process_pipelines(args):
+    from .parallel import (process_pipelines_in_parallel, shutdown_prover_pool,
+                           PARALLEL_THRESHOLD)
+    init_globals(args.debug, args.traceback,
+                 args.cache_directory, args.expect_unexpected)
+
+    try:
+        # Worker processes can't read the parent's stdin
+        reads_stdin = any(fpath == "-" for fpath, _ in args.pipelines)
+        if (args.jobs > 1 and len(args.pipelines) >= PARALLEL_THRESHOLD
+                and not reads_stdin):
+            process_pipelines_in_parallel(
+                args, _process_pipeline_in_worker, init_globals)
+        else:
+            # All inputs share the same frontend and backend, hence the same
+            # pipeline
+            fpaths = [fpath for fpath, _ in args.pipelines]
+            process_pipeline(fpaths, args.pipelines[0][1], args)
+    finally:
+        shutdown_prover_pool()
 
 def main():
     try:
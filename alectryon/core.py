@@ -21,7 +21,7 @@
 from collections import namedtuple
 from collections.abc import Iterable
 from textwrap import indent
-from sys import stderr
+from sys import stderr, intern
 
 from shlex import quote
 from shutil import which
@@ -32,10 +32,11 @@ DEBUG = False
 TRACEBACK = False
 
 def debug(text, prefix):
+    if not DEBUG: # Called on every message sent to or received from SerAPI
+        return
     if isinstance(text, (bytes, bytearray)):
         text = text.decode("utf-8", errors="replace")
-    if DEBUG:
-        print(indent(text.rstrip(), prefix), flush=True)
+    print(indent(text.rstrip(), prefix), flush=True)
 
 class GeneratorInfo(namedtuple("GeneratorInfo", "name version")):
     def fmt(self, include_version_info=True):
@@ -64,6 +65,7 @@ def utf8(x):
 ApiAck = namedtuple("ApiAck", "")
 ApiCompleted = namedtuple("ApiCompleted", "")
 ApiAdded = namedtuple("ApiAdded", "sid loc")
+ApiCanceled = namedtuple("ApiCanceled", "sids")
 ApiExn = namedtuple("ApiExn", "sids exn loc")
 ApiMessage = namedtuple("ApiMessage", "sid level msg")
 ApiString = namedtuple("ApiString", "string")
@@ -80,6 +82,7 @@ class SerAPI():
 
     MIN_PP_MARGIN = 20
     DEFAULT_PP_ARGS = {'pp_depth': 30, 'pp_margin': 55}
+    PIPE_BUFSIZE = 64 * 1024
 
     @staticmethod
     def version_info(sertop_bin=SERTOP_BIN):
@@ -95,6 +98,7 @@ class SerAPI():
         self.next_qid = 0
         self.pp_args = {**SerAPI.DEFAULT_PP_ARGS, **pp_args}
         self.last_response = None
+        self.added_sids = []
 
     def __enter__(self):
         self.reset()
@@ -115,9 +119,13 @@ class SerAPI():
                    " please run `opam install coq-serapi`")
             raise ValueError(msg.format(self.sertop_bin))
         self.kill()
+        self.added_sids = []
         cmd = [path, *self.args]
         debug(" ".join(quote(s) for s in cmd), '# ')
-        self.sertop = Popen(cmd, stdin=PIPE, stderr=stderr, stdout=PIPE)
+        # Answers (goals especially) are often larger than the default 8k
+        # buffer; a larger buffer lets ‘readline’ get them in fewer reads.
+        self.sertop = Popen(cmd, stdin=PIPE, stderr=stderr, stdout=PIPE,
+                            bufsize=SerAPI.PIPE_BUFSIZE)
 
     def next_sexp(self):
         """Wait for the next sertop prompt, and return the output preceding it."""
@@ -131,12 +139,19 @@ class SerAPI():
         debug(response, '<< ')
         return sexp
 
-    def _send(self, sexp):
+    def _dump_query(self, sexp):
         s = sx.dump([b'query%d' % self.next_qid, sexp])
         self.next_qid += 1
-        debug(s, '>> ')
-        self.sertop.stdin.write(s + b'\n')
-        self.sertop.stdin.flush()
+        return s + b'\n'
+
+    def _write(self, query, flush=True):
+        debug(query, '>> ')
+        self.sertop.stdin.write(query)
+        if flush:
+            self.sertop.stdin.flush()
+
+    def _send(self, sexp):
+        self._write(self._dump_query(sexp))
 
     @staticmethod
     def _deserialize_loc(loc):
@@ -148,7 +163,8 @@ class SerAPI():
         meta, body, htype = sexp
         assert len(body) <= 1
         body = body[0] if body else None
-        ids = [sx.tostr(p[1]) for p in meta if p[0] == b'Id']
+        # Names repeat across goals; interning them saves memory
+        ids = [intern(sx.tostr(p[1])) for p in meta if p[0] == b'Id']
         yield Hypothesis(ids, body, htype)
 
     @staticmethod
@@ -167,6 +183,8 @@ class SerAPI():
             yield ApiCompleted()
         elif tag == b'Added':
             yield ApiAdded(sexp[1], SerAPI._deserialize_loc(sexp[2]))
+        elif tag == b'Canceled':
+            yield ApiCanceled(sexp[1])
         elif tag == b'ObjList':
             for tag, *obj in sexp[1]:
                 if tag == b'CoqString':
@@ -247,9 +265,8 @@ class SerAPI():
                 if (not types) or isinstance(response, types):
                     yield response
 
-    def _pprint(self, sexp, sid, kind, pp_depth, pp_margin):
-        if sexp is None:
-            return PrettyPrinted(sid, None)
+    @staticmethod
+    def _pprint_query(sexp, sid, kind, pp_depth, pp_margin):
         if kind is not None:
             sexp = [kind, sexp]
         meta = [[b'sid', sid],
@@ -257,26 +274,74 @@ class SerAPI():
                  [[b'pp_format', b'PpStr'],
                   [b'pp_depth', utf8(pp_depth)],
                   [b'pp_margin', utf8(pp_margin)]]]]
-        self._send([b'Print', meta, sexp])
+        return [b'Print', meta, sexp]
+
+    def _pprint_answer(self, sid):
         strings = list(self._collect_messages(ApiString, None, sid))
         if strings:
             assert len(strings) == 1
             return PrettyPrinted(sid, strings[0].string)
         raise ValueError("No string found in Print answer")
 
-    def _pprint_message(self, msg):
-        return self._pprint(msg.msg, msg.sid, b'CoqPp', **self.pp_args)
+    def _pprint(self, sexp, sid, kind, pp_depth, pp_margin):
+        if sexp is None:
+            return PrettyPrinted(sid, None)
+        self._send(self._pprint_query(sexp, sid, kind, pp_depth, pp_margin))
+        return self._pprint_answer(sid)
+
+    PIPELINE_BYTES = 32 * 1024
+    """Maximum size of queries sent to sertop before reading answers.
+
+    Staying well below the capacity of a pipe ensures that sertop can't
+    deadlock writing answers that we aren't reading yet.  A single larger
+    query is only sent once all previous answers have been read.
+    """
+
+    def _pprint_all(self, requests):
+        """Pretty-print each of `requests` (argument tuples for ``_pprint``).
+
+        Queries are independent, so they are sent in batches (with a single
+        flush each), and answers are read back in order.
+        """
+        printed, pending, pending_bytes = [None] * len(requests), [], 0
+
+        def drain():
+            self.sertop.stdin.flush()
+            for idx in pending:
+                printed[idx] = self._pprint_answer(requests[idx][1])
+            pending.clear()
+
+        for idx, (sexp, sid, kind, pp_depth, pp_margin) in enumerate(requests):
+            if sexp is None:
+                printed[idx] = PrettyPrinted(sid, None)
+                continue
+            query = self._dump_query(
+                self._pprint_query(sexp, sid, kind, pp_depth, pp_margin))
+            if pending and pending_bytes + len(query) > self.PIPELINE_BYTES:
+                drain()
+                pending_bytes = 0
+            self._write(query, flush=False)
+            pending_bytes += len(query)
+            pending.append(idx)
+        drain()
+        return printed
+
+    def _pprint_messages(self, msgs):
+        d, w = self.pp_args['pp_depth'], self.pp_args['pp_margin']
+        return self._pprint_all([(msg.msg, msg.sid, b'CoqPp', d, w) for msg in msgs])
 
     def _exec(self, sid, chunk):
         self._send([b'Exec', sid])
         messages = list(self._collect_messages(ApiMessage, chunk, sid))
-        return [self._pprint_message(msg) for msg in messages]
+        return self._pprint_messages(messages)
 
-    def _add(self, chunk):
+    def _add_spans(self, chunk, types=(ApiAdded, ApiMessage)):
+        """Add `chunk`; return its spans and its (unprinted) messages."""
         self._send([b'Add', [], sx.escape(chunk)])
         prev_end, spans, messages = 0, [], []
-        for response in self._collect_messages((ApiAdded, ApiMessage), chunk, None):
+        for response in self._collect_messages(types, chunk, None):
             if isinstance(response, ApiAdded):
+                self.added_sids.append(response.sid)
                 start, end = response.loc
                 if start != prev_end:
                     spans.append((None, chunk[prev_end:start]))
@@ -286,27 +351,50 @@ class SerAPI():
                 messages.append(response)
         if prev_end != len(chunk):
             spans.append((None, chunk[prev_end:]))
-        return spans, [self._pprint_message(msg) for msg in messages]
+        return spans, messages
+
+    def _add(self, chunk):
+        spans, messages = self._add_spans(chunk)
+        return spans, self._pprint_messages(messages)
 
-    def _pprint_hyp(self, hyp, sid):
+    def _hyp_pprint_requests(self, hyp, sid):
         d = self.pp_args['pp_depth']
         name_w = max(len(n) for n in hyp.names)
         w = max(self.pp_args['pp_margin'] - name_w, SerAPI.MIN_PP_MARGIN)
-        body = self._pprint(hyp.body, sid, b'CoqExpr', d, w - 2).pp
-        htype = self._pprint(hyp.type, sid, b'CoqExpr', d, w - 3).pp
-        return Hypothesis(hyp.names, body, htype)
-
-    def _pprint_goal(self, goal, sid):
-        ccl = self._pprint(goal.conclusion, sid, b'CoqExpr', **self.pp_args).pp
-        hyps = [self._pprint_hyp(h, sid) for h in goal.hypotheses]
-        return Goal(sx.tostr(goal.name) if goal.name else None, ccl, hyps)
+        return [(hyp.body, sid, b'CoqExpr', d, w - 2),
+                (hyp.type, sid, b'CoqExpr', d, w - 3)]
+
+    def _pprint_goals(self, goals, sid):
+        d, w = self.pp_args['pp_depth'], self.pp_args['pp_margin']
+        requests = []
+        for goal in goals:
+            requests.append((goal.conclusion, sid, b'CoqExpr', d, w))
+            for hyp in goal.hypotheses:
+                requests.extend(self._hyp_pprint_requests(hyp, sid))
+        printed = iter(self._pprint_all(requests))
+        # A list rather than a generator, since ‘next’ is called on `printed`
+        result = []
+        for goal in goals:
+            ccl = next(printed).pp
+            hyps = [Hypothesis(hyp.names, next(printed).pp, next(printed).pp)
+                    for hyp in goal.hypotheses]
+            result.append(Goal(sx.tostr(goal.name) if goal.name else None, ccl, hyps))
+        return result
 
     def _goals(self, sid, chunk):
         # LATER Goals instead and CoqGoal and CoqConstr?
         # LATER We'd like to retrieve the formatted version directly
         self._send([b'Query', [[b'sid', sid]], b'EGoals'])
         goals = list(self._collect_messages(Goal, chunk, sid))
-        yield from (self._pprint_goal(g, sid) for g in goals)
+        yield from self._pprint_goals(goals, sid)
+
+    def cancel_all(self):
+        """Cancel all sentences added so far, restoring sertop's initial state."""
+        if self.added_sids:
+            # Cancelling a sentence also cancels all sentences that follow it
+            self._send([b'Cancel', [self.added_sids[0]]])
+            list(self._collect_messages(ApiCanceled, None, None))
+            self.added_sids = []
 
     def run(self, chunk):
         """Send a `chunk` to sertop.
@@ -342,6 +430,31 @@ class SerAPI():
                 fragment.messages.append(Message(message.pp))
         return fragments
 
+    def replay(self, chunk):
+        """Execute `chunk` without collecting its goals, messages, or errors."""
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        chunk = memoryview(chunk)
+        # Errors are reported by the instance that annotates `chunk`
+        quiet = (ApiAdded, ApiMessage, ApiExn)
+        spans, _ = self._add_spans(chunk, quiet)
+        for span_id, _ in spans:
+            if span_id is not None:
+                self._send([b'Exec', span_id])
+                list(self._collect_messages(quiet, chunk, span_id))
+
+    def annotate_reuse(self, chunks, prefix=()):
+        """Annotate `chunks` in this (already started) ``sertop`` instance.
+
+        Sentences left over from previous calls are cancelled first, so a
+        single instance can be used to process multiple documents.  Chunks in
+        `prefix` are executed before `chunks`, but not annotated.
+        """
+        self.cancel_all()
+        for chunk in prefix:
+            self.replay(chunk)
+        return [self.run(chunk) for chunk in chunks]
+
 def annotate(chunks, sertop_args=()):
     """Annotate multiple `chunks` of Coq code.
 
@@ -354,4 +467,4 @@ def annotate(chunks, sertop_args=()):
     [[Sentence(contents='Check 1.', messages=[Message(contents='1\n     : nat')], goals=[])]]
     """
     with SerAPI(args=sertop_args) as api:
-        return [api.run(chunk) for chunk in chunks]
+        return api.annotate_reuse(chunks)
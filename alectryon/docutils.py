@@ -77,7 +77,7 @@ from docutils.transforms import Transform
 from docutils.writers import html4css1, latex2e, xetex
 
 from . import transforms
-from .core import annotate, SerAPI
+from .core import annotate as core_annotate, SerAPI
 from .html import ADDITIONAL_HEADS, HtmlGenerator, gen_banner, wrap_classes, ASSETS as ASSETS_HTML
 from .latex import LatexGenerator, ASSETS as ASSETS_LATEX
 from .pygments import highlight_html, highlight_latex, added_tokens, replace_builtin_coq_lexer
@@ -171,6 +171,9 @@ class AlectryonTransform(Transform):
     SERTOP_ARGS = ()
     """Arguments to pass to SerAPI, in SerAPI format."""
 
+    ANNOTATE = staticmethod(core_annotate)
+    """Function used to annotate chunks, called with chunks and `SERTOP_ARGS`."""
+
     @staticmethod
     def set_fragment_annots(fragments, annots):
         """Apply relevant annotations to all unannotated fragments."""
@@ -190,7 +193,8 @@ class AlectryonTransform(Transform):
     def annotate_cached(self, chunks, sertop_args):
         from .json import Cache
         cache = Cache(CACHE_DIRECTORY, self.document['source'], sertop_args)
-        annotated = cache.update(chunks, lambda c: annotate(c, sertop_args), SerAPI.version_info())
+        annotated = cache.update(chunks, lambda c: self.ANNOTATE(c, sertop_args),
+                                 SerAPI.version_info())
         return cache.generator, annotated
 
     def annotate(self, pending_nodes):
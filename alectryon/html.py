@@ -19,10 +19,10 @@
 # SOFTWARE.
 
 from collections import defaultdict
+from functools import lru_cache
+from itertools import count
 from os import path
 
-from dominate import tags
-
 from .core import Text, RichSentence, Goals, Messages
 from . import transforms, GENERATOR
 
@@ -47,11 +47,10 @@ class ASSETS:
 class Gensym():
     def __init__(self, stem):
         self.stem = stem
-        self.counters = defaultdict(lambda: -1)
+        self.counters = defaultdict(count)
 
     def __call__(self, prefix):
-        self.counters[prefix] += 1
-        return self.stem + prefix + hex(self.counters[prefix])[len("0x"):]
+        return f"{self.stem}{prefix}{next(self.counters[prefix]):x}"
 
 # pylint: disable=line-too-long
 HEADER = (
@@ -66,69 +65,190 @@ HEADER = (
 def gen_banner(generator, include_version_info=True):
     return HEADER.format(generator.fmt(include_version_info)) if generator else ""
 
+@lru_cache(maxsize=64)
 def wrap_classes(*cls):
     return " ".join("alectryon-" + c for c in ("root", *cls))
 
+# Class strings used for every sentence or goal
+CLS_SEPARATOR = "goal-separator"
+CLS_SEPARATOR_TOGGLE = "goal-separator alectryon-extra-goal-label"
+CLS_INPUT = "alectryon-input"
+CLS_INPUT_FAILED = "alectryon-input alectryon-failed"
+CLS_IO = "alectryon-io"
+
+def escape(s):
+    """Escape `s` for inclusion in HTML text or attributes (as ``dominate`` does)."""
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+class Out:
+    """A buffer of HTML strings.
+
+    Building HTML this way is much faster than creating ``dominate`` tags,
+    which matters for large documents.  Attributes are rendered in sorted
+    order and attributes set to ``None`` or ``False`` are omitted, as in
+    ``dominate``; ``cls`` stands for ``class``.
+    """
+    def __init__(self):
+        self.buf = []
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def start_tag(tag, **attrs):
+        """Render an opening `tag` with `attrs`.
+
+        Most tags in generated code have the same few sets of attributes, so
+        rendered tags are cached; tags with unique attributes (such as ``id``)
+        just cycle through the cache.
+        """
+        attrs = sorted(("class" if k == "cls" else k, v) for k, v in attrs.items()
+                       if v is not None and v is not False)
+        return "<{}{}>".format(tag, "".join(' {}="{}"'.format(k, escape(str(v)))
+                                            for k, v in attrs))
+
+    def open(self, tag, **attrs):
+        self.buf.append(self.start_tag(tag, **attrs))
+
+    def close(self, tag):
+        self.buf.append("</" + tag + ">")
+
+    def text(self, s):
+        self.buf.append(escape(s))
+
+    def raw(self, s):
+        self.buf.append(s)
+
+    def leaf(self, tag, s, **attrs):
+        """Add a `tag` element containing just text `s`."""
+        self.buf.append(self.start_tag(tag, **attrs) + escape(s) + "</" + tag + ">")
+
+    def render(self):
+        return "".join(self.buf)
+
+HYP_WITHOUT_BODY = (
+    '<div class="goal-hyp"><span class="hyp-names">{names}</span>'
+    '<span><span class="hyp-type-block"><span class="hyp-punct">:</span>'
+    '<span class="hyp-type">{htype}</span></span></span></div>'
+)
+
 class HtmlGenerator:
     def __init__(self, highlighter, gensym_stem=""):
         self.highlight = highlighter
         self.gensym = Gensym(gensym_stem + "-" if gensym_stem else "")
+        self.hyp_cache = {}
+        self.out = Out()
 
-    @staticmethod
-    def gen_label(toggle, cls, *contents):
+        # Dispatch on exact types (bound methods, so subclasses can override)
+        self.output_generators = {Messages: self.gen_messages,
+                                  Goals: self.gen_goals_output}
+        self.fragment_generators = {Text: self.gen_text,
+                                    RichSentence: self.gen_sentence}
+
+        @lru_cache(maxsize=8192)
+        def highlight_to_str(s):
+            # Highlighters may return ``dominate`` tags or plain HTML strings
+            html = highlighter(s)
+            return html if isinstance(html, str) else html.render(pretty=False)
+        # Short strings (``nat``, ``Prop``, common tactics, …) are
+        # highlighted over and over, so cache highlighted HTML.
+        self.highlight_to_str = highlight_to_str
+
+    def gen_highlighted(self, s):
+        self.out.raw(self.highlight_to_str(s))
+
+    def open_label(self, toggle, cls):
         if toggle:
-            return tags.label(*contents, cls=cls, **{"for": toggle})
-        return tags.span(*contents, cls=cls)
+            self.out.open("label", cls=cls, **{"for": toggle})
+            return "label"
+        self.out.open("span", cls=cls)
+        return "span"
+
+    def gen_hyp(self, hyp):
+        # Hypotheses are repeated across goals and sentences, so render each
+        # one only once.
+        out = self.out
+        try:
+            key = (tuple(hyp.names), hyp.body, hyp.type)
+            html = self.hyp_cache.get(key)
+        except TypeError: # Unhashable contents: render without caching
+            key = html = None
+        if html is not None:
+            out.raw(html)
+            return
+        if not hyp.body: # Most hypotheses have no body
+            html = HYP_WITHOUT_BODY.format(
+                names=escape(", ".join(hyp.names)),
+                htype=self.highlight_to_str(hyp.type))
+            out.raw(html)
+            if key is not None:
+                self.hyp_cache[key] = html
+            return
+        start = len(out.buf)
+        out.open("div", cls="goal-hyp")
+        out.leaf("span", ", ".join(hyp.names), cls="hyp-names")
+        out.open("span")
+        if hyp.body:
+            out.open("span", cls="hyp-body-block")
+            out.leaf("span", ":=", cls="hyp-punct")
+            out.open("span", cls="hyp-body")
+            self.gen_highlighted(hyp.body)
+            out.close("span")
+            out.close("span")
+        out.open("span", cls="hyp-type-block")
+        out.leaf("span", ":", cls="hyp-punct")
+        out.open("span", cls="hyp-type")
+        self.gen_highlighted(hyp.type)
+        out.close("span")
+        out.close("span")
+        out.close("span")
+        out.close("div")
+        out.buf[start:] = [html] = ["".join(out.buf[start:])]
+        if key is not None:
+            self.hyp_cache[key] = html
 
     def gen_hyps(self, hyps):
-        with tags.div(cls="goal-hyps"):
-            for hyp in hyps:
-                with tags.div(cls="goal-hyp"):
-                    tags.span(", ".join(hyp.names), cls="hyp-names")
-                    with tags.span():
-                        if hyp.body:
-                            with tags.span(cls="hyp-body-block"):
-                                tags.span(":=", cls="hyp-punct")
-                                with tags.span(cls="hyp-body"):
-                                    self.highlight(hyp.body)
-                        with tags.span(cls="hyp-type-block"):
-                            tags.span(":", cls="hyp-punct")
-                            with tags.span(cls="hyp-type"):
-                                self.highlight(hyp.type)
+        self.out.open("div", cls="goal-hyps")
+        for hyp in hyps:
+            self.gen_hyp(hyp)
+        self.out.close("div")
 
     def gen_goal(self, goal, toggle=None):
         """Serialize a goal to HTML."""
-        with tags.blockquote(cls="alectryon-goal"):
-            if goal.hypotheses:
-                # Chrome doesn't support the ‘gap’ property in flex containers,
-                # so properly spacing hypotheses requires giving them margins
-                # and giving negative margins to their container.  This breaks
-                # when the container is empty, so just omit the hypotheses if
-                # there are none.
-                self.gen_hyps(goal.hypotheses)
-            toggle = goal.hypotheses and toggle
-            cls = "goal-separator" + (" alectryon-extra-goal-label" if toggle else "")
-            with self.gen_label(toggle, cls):
-                tags.hr()
-                if goal.name:
-                    tags.span(goal.name, cls="goal-name")
-            tags.div(self.highlight(goal.conclusion), cls="goal-conclusion")
+        out = self.out
+        out.open("blockquote", cls="alectryon-goal")
+        if goal.hypotheses:
+            # Chrome doesn't support the ‘gap’ property in flex containers,
+            # so properly spacing hypotheses requires giving them margins
+            # and giving negative margins to their container.  This breaks
+            # when the container is empty, so just omit the hypotheses if
+            # there are none.
+            self.gen_hyps(goal.hypotheses)
+        toggle = goal.hypotheses and toggle
+        cls = CLS_SEPARATOR_TOGGLE if toggle else CLS_SEPARATOR
+        tag = self.open_label(toggle, cls)
+        out.open("hr")
+        if goal.name:
+            out.leaf("span", goal.name, cls="goal-name")
+        out.close(tag)
+        out.open("div", cls="goal-conclusion")
+        self.gen_highlighted(goal.conclusion)
+        out.close("div")
+        out.close("blockquote")
 
     def gen_checkbox(self, checked, cls):
         nm = self.gensym("chk")
-        attrs = {"style": "display: none"} # Most RSS readers ignore stylesheets
-        if checked:
-            attrs["checked"] = "checked"
-        tags.input_(type="checkbox", id=nm, cls=cls, **attrs)
+        # Most RSS readers ignore stylesheets, hence the ‘style’ attribute
+        self.out.open("input", type="checkbox", id=nm, cls=cls,
+                      style="display: none", checked=checked and "checked")
         return nm
 
     def gen_goals(self, first, more):
         self.gen_goal(first)
         if more:
-            with tags.div(cls='alectryon-extra-goals'):
-                for goal in more:
-                    nm = self.gen_checkbox(False, "alectryon-extra-goal-toggle")
-                    self.gen_goal(goal, toggle=nm)
+            self.out.open("div", cls='alectryon-extra-goals')
+            for goal in more:
+                nm = self.gen_checkbox(False, "alectryon-extra-goal-toggle")
+                self.gen_goal(goal, toggle=nm)
+            self.out.close("div")
 
     def gen_input_toggle(self, fr):
         if not fr.outputs:
@@ -136,58 +256,81 @@ class HtmlGenerator:
         return self.gen_checkbox(fr.annots.unfold, "alectryon-toggle")
 
     def gen_input(self, fr, toggle):
-        cls = "alectryon-input" + (" alectryon-failed" if fr.annots.fails else "")
-        self.gen_label(toggle, cls, self.highlight(fr.contents))
+        cls = CLS_INPUT_FAILED if fr.annots.fails else CLS_INPUT
+        tag = self.open_label(toggle, cls)
+        self.gen_highlighted(fr.contents)
+        self.out.close(tag)
+
+    def gen_messages(self, output):
+        assert output.messages, "transforms.commit_io_annotations"
+        out = self.out
+        out.open("div", cls="alectryon-messages")
+        for message in output.messages:
+            out.open("blockquote", cls="alectryon-message")
+            self.gen_highlighted(message.contents)
+            out.close("blockquote")
+        out.close("div")
+
+    def gen_goals_output(self, output):
+        assert output.goals, "transforms.commit_io_annotations"
+        self.out.open("div", cls="alectryon-goals")
+        self.gen_goals(output.goals[0], output.goals[1:])
+        self.out.close("div")
 
     def gen_output(self, fr):
+        out = self.out
         # Using <small> improves rendering in RSS feeds
-        wrapper = tags.div(cls="alectryon-output-sticky-wrapper")
-        with tags.small(cls="alectryon-output").add(wrapper):
-            for output in fr.outputs:
-                if isinstance(output, Messages):
-                    assert output.messages, "transforms.commit_io_annotations"
-                    with tags.div(cls="alectryon-messages"):
-                        for message in output.messages:
-                            tags.blockquote(self.highlight(message.contents),
-                                            cls="alectryon-message")
-                if isinstance(output, Goals):
-                    assert output.goals, "transforms.commit_io_annotations"
-                    with tags.div(cls="alectryon-goals"):
-                        self.gen_goals(output.goals[0], output.goals[1:])
+        out.open("small", cls="alectryon-output")
+        out.open("div", cls="alectryon-output-sticky-wrapper")
+        for output in fr.outputs:
+            gen = self.output_generators.get(type(output))
+            if gen:
+                gen(output)
+        out.close("div")
+        out.close("small")
 
-    @staticmethod
-    def gen_whitespace(wsps):
+    def gen_whitespace(self, wsps):
         for wsp in wsps:
-            tags.span(wsp, cls="alectryon-wsp")
+            self.out.leaf("span", wsp, cls="alectryon-wsp")
 
     def gen_sentence(self, fr):
         if fr.contents is not None:
             self.gen_whitespace(fr.prefixes)
-        with tags.span(cls="alectryon-sentence"):
-            toggle = self.gen_input_toggle(fr)
-            if fr.contents is not None:
-                self.gen_input(fr, toggle)
-            if fr.outputs:
-                self.gen_output(fr)
-            if fr.contents is not None:
-                self.gen_whitespace(fr.suffixes)
+        self.out.open("span", cls="alectryon-sentence")
+        toggle = self.gen_input_toggle(fr)
+        if fr.contents is not None:
+            self.gen_input(fr, toggle)
+        if fr.outputs:
+            self.gen_output(fr)
+        if fr.contents is not None:
+            self.gen_whitespace(fr.suffixes)
+        self.out.close("span")
+
+    def gen_text(self, fr):
+        self.out.open("span", cls="alectryon-wsp")
+        self.gen_highlighted(fr.contents)
+        self.out.close("span")
 
     def gen_fragment(self, fr):
-        if isinstance(fr, Text):
-            tags.span(self.highlight(fr.contents), cls="alectryon-wsp")
-        else:
-            assert isinstance(fr, RichSentence)
-            self.gen_sentence(fr)
+        gen = self.fragment_generators.get(type(fr))
+        assert gen, fr
+        gen(fr)
 
     def gen_fragments(self, fragments, classes=()):
-        """Serialize a list of `fragments` to HTML."""
-        with tags.pre(cls=" ".join(("alectryon-io", *classes))) as pre:
-            tags.comment(" Generator: {} ".format(GENERATOR))
-            fragments = transforms.group_whitespace_with_code(fragments)
-            fragments = transforms.commit_io_annotations(fragments)
-            for fr in fragments:
-                self.gen_fragment(fr)
-            return pre
+        """Serialize a list of `fragments` to HTML.
+
+        The result is a single ``dominate`` node holding the raw HTML code.
+        """
+        self.out = out = Out()
+        out.open("pre", cls=" ".join((CLS_IO, *classes)) if classes else CLS_IO)
+        out.raw("<!-- Generator: {} -->".format(escape(GENERATOR)))
+        fragments = transforms.group_whitespace_with_code(fragments)
+        fragments = transforms.commit_io_annotations(fragments)
+        for fr in fragments:
+            self.gen_fragment(fr)
+        out.close("pre")
+        from dominate.util import raw # Slow to import, and not always needed
+        return raw(out.render())
 
     def gen(self, annotated):
         for fragments in annotated:
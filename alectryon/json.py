@@ -19,11 +19,30 @@
 # SOFTWARE.
 
 import json
-from os import path, makedirs
+from sys import intern
+from hashlib import blake2b
+from os import path, makedirs, replace, unlink
 from itertools import zip_longest
+from tempfile import mkstemp
 
 from . import core
 
+try:
+    # ``orjson`` is much faster than ``json``, and optional.
+    import orjson # pylint: disable=import-error
+except ImportError:
+    orjson = None
+
+def loads(bs):
+    """Parse JSON from bytes `bs`."""
+    # pylint: disable=no-member
+    return orjson.loads(bs) if orjson else json.loads(bs)
+
+def dumps(obj):
+    """Serialize `obj` to compact JSON bytes."""
+    # pylint: disable=no-member
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode("utf-8")
+
 TYPE_OF_ALIASES = {
     "text": core.Text,
     "hypothesis": core.Hypothesis,
@@ -39,37 +58,57 @@ ALIASES_OF_TYPE = {
     cls.__name__: alias for (alias, cls) in TYPE_OF_ALIASES.items()
 }
 
-TYPES = list(TYPE_OF_ALIASES.values())
+TYPES = tuple(TYPE_OF_ALIASES.values())
+
+ALIAS_AND_FIELDS_OF_CLASS = {
+    cls: (alias, cls._fields) for (alias, cls) in TYPE_OF_ALIASES.items()
+}
+
+# The functions below dispatch on exact types (checking for the most common
+# cases first) because they run on every node of annotated documents.
 
 def json_of_annotated(obj):
-    if isinstance(obj, list):
+    t = type(obj)
+    if t is str or obj is None:
+        return obj
+    if t is list or t is tuple:
         return [json_of_annotated(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: json_of_annotated(v) for k, v in obj.items()}
-    type_name = ALIASES_OF_TYPE.get(type(obj).__name__)
-    if type_name:
-        d = {"_type": type_name}
-        for k, v in zip(obj._fields, obj):
+    alias_and_fields = ALIAS_AND_FIELDS_OF_CLASS.get(t)
+    if alias_and_fields:
+        alias, fields = alias_and_fields
+        d = {"_type": alias}
+        for k, v in zip(fields, obj):
             d[k] = json_of_annotated(v)
         return d
-    assert obj is None or isinstance(obj, (int, str))
+    if isinstance(obj, dict):
+        return {k: json_of_annotated(v) for k, v in obj.items()}
+    assert isinstance(obj, (int, str))
     return obj
 
 def minimal_json_of_annotated(obj):
-    if isinstance(obj, list):
+    t = type(obj)
+    if t is str or obj is None:
+        return obj
+    if t is list or t is tuple:
         return [minimal_json_of_annotated(x) for x in obj]
-    if isinstance(obj, dict):
-        return {k: minimal_json_of_annotated(v) for k, v in obj.items()}
-    type_name = ALIASES_OF_TYPE.get(type(obj).__name__)
-    if type_name:
-        if isinstance(obj, core.Text):
-            return obj.contents
-        d = {k: minimal_json_of_annotated(v) for k, v in zip(obj._fields, obj)}
-        contents = d.pop("contents", None)
-        d = {k: v for k, v in d.items() if v}
+    if t is core.Text:
+        return obj.contents
+    alias_and_fields = ALIAS_AND_FIELDS_OF_CLASS.get(t)
+    if alias_and_fields:
+        alias, fields = alias_and_fields
+        d, contents = {}, None
+        for k, v in zip(fields, obj):
+            if k == "contents":
+                contents = minimal_json_of_annotated(v)
+            else:
+                v = minimal_json_of_annotated(v)
+                if v:
+                    d[k] = v
         if contents:
-            d[type_name] = contents
+            d[alias] = contents
         return d
+    if isinstance(obj, dict):
+        return {k: minimal_json_of_annotated(v) for k, v in obj.items()}
     return obj
 
 def annotated_of_json(js):
@@ -81,22 +120,34 @@ def annotated_of_json(js):
         obj = {k: annotated_of_json(v) for k, v in js.items()}
         if type_constr:
             del obj["_type"]
+            if type_constr is core.Hypothesis:
+                obj["names"] = [intern(n) for n in obj["names"]]
             return type_constr(**obj)
         return obj
     return js
 
 def validate_inputs(annotated, reference):
-    if isinstance(annotated, list):
-        if not isinstance(reference, list):
-            print(f"Mismatch: {annotated} {reference}")
+    # Walk the trees with a stack of iterators instead of recursing: inputs can
+    # be long and deeply nested.
+    stack = [iter(((annotated, reference),))]
+    while stack:
+        pair = next(stack[-1], None)
+        if pair is None:
+            stack.pop()
+            continue
+        annotated, reference = pair
+        if isinstance(annotated, list):
+            if not isinstance(reference, list):
+                print(f"Mismatch: {annotated} {reference}")
+                return False
+            stack.append(zip_longest(annotated, reference))
+        elif isinstance(annotated, TYPES):
+            if annotated.contents != reference:
+                print(f"Mismatch: {annotated.contents} {reference}")
+                return False
+        else:
             return False
-        return all(validate_inputs(*p) for p in zip_longest(annotated, reference))
-    # pylint: disable=isinstance-second-argument-not-valid-type
-    if isinstance(annotated, TYPES):
-        if annotated.contents != reference:
-            print(f"Mismatch: {annotated.contents} {reference}")
-        return annotated.contents == reference
-    return False
+    return True
 
 class BaseCache:
     def get(self, chunks):
@@ -135,14 +186,27 @@ class FileCache(BaseCache):
             return {k: FileCache.normalize(v) for (k, v) in obj.items()}
         return obj
 
+    @staticmethod
+    def json_eq(obj, js):
+        """Compare `obj` with deserialized JSON `js`, treating tuples as lists.
+
+        This is equivalent to ``normalize(obj) == js``, without copying `obj`.
+        """
+        if isinstance(obj, (list, tuple)):
+            return (isinstance(js, list) and len(obj) == len(js)
+                    and all(FileCache.json_eq(o, j) for o, j in zip(obj, js)))
+        if isinstance(obj, dict):
+            return (isinstance(js, dict) and obj.keys() == js.keys()
+                    and all(FileCache.json_eq(v, js[k]) for k, v in obj.items()))
+        return obj == js
+
     def _validate(self, data, reference):
         metadata = data.get("metadata")
         if self.metadata != metadata:
             MSG = "Outdated metadata in {} ({} != {}): recomputing annotations"
             print(MSG.format(self.cache_rel_file, self.metadata, metadata))
             return False
-        reference = self.normalize(reference)
-        if reference != data.get("chunks"):
+        if not self.json_eq(reference, data.get("chunks")):
             MSG = "Outdated contents in {}: recomputing"
             print(MSG.format(self.cache_rel_file))
             return False
@@ -150,8 +214,8 @@ class FileCache(BaseCache):
 
     def _read(self):
         try:
-            with open(self.cache_file) as cache:
-                return self.normalize(json.load(cache))
+            with open(self.cache_file, mode="rb") as cache:
+                return loads(cache.read())
         except FileNotFoundError:
             return None
 
@@ -165,12 +229,74 @@ class FileCache(BaseCache):
         return core.GeneratorInfo(*self.data.get("generator", ("Coq+SerAPI", "??")))
 
     def put(self, chunks, annotated, generator):
-        with open(self.cache_file, mode="w") as cache:
-            self.data = {"generator": generator,
-                         "metadata": self.metadata,
-                         "chunks": list(chunks),
-                         "annotated": json_of_annotated(annotated)}
-            json.dump(self.data, cache, indent=2)
+        self.data = {"generator": list(generator),
+                     "metadata": self.metadata,
+                     "chunks": list(chunks),
+                     "annotated": json_of_annotated(annotated)}
+        # Caches are meant to be checked in and diffed, hence the indentation.
+        if orjson:
+            # pylint: disable=no-member
+            js = orjson.dumps(self.data, option=orjson.OPT_INDENT_2)
+            # Same bytes as ‘json’, unless ‘json’ would escape some characters
+            if js.isascii() and b"\x7f" not in js:
+                with open(self.cache_file, mode="wb") as cache:
+                    cache.write(js)
+                return
+        # ‘writelines’ streams the encoder's output without a Python-level
+        # ‘write’ per token (as in ‘dump’) or a copy of the whole file in
+        # memory (as in ‘dumps’); the data is a tree, so skip circularity checks.
+        encoder = json.JSONEncoder(indent=2, check_circular=False)
+        with open(self.cache_file, mode="w", encoding="utf-8",
+                  buffering=1 << 16) as cache:
+            cache.writelines(encoder.iterencode(self.data))
+
+class ContentCache(BaseCache):
+    """A cache of annotations indexed by a hash of their inputs.
+
+    Unlike ``FileCache``, entries are not tied to a document: any document
+    whose chunks and metadata match an existing entry reuses its annotations.
+    Entries are named after hashes, so `cache_root` should be a dedicated
+    directory, not one that is checked in.  `metadata` should identify the
+    prover (its arguments and version): it is part of each entry's key.
+    """
+    CACHE_VERSION = "1"
+
+    def __init__(self, cache_root, metadata):
+        self.cache_root = cache_root
+        self.metadata = FileCache.normalize(metadata)
+        self.metadata["cache_version"] = self.CACHE_VERSION
+
+    def _cache_file(self, chunks):
+        h = blake2b()
+        for chunk in chunks:
+            h.update(chunk.encode("utf-8"))
+            h.update(b"\0")
+        h.update(json.dumps(self.metadata, sort_keys=True).encode("utf-8"))
+        key = h.hexdigest()
+        return path.join(self.cache_root, key[:2], key + ".json")
+
+    def get(self, chunks):
+        try:
+            with open(self._cache_file(chunks), mode="rb") as cache:
+                return annotated_of_json(loads(cache.read())["annotated"])
+        except FileNotFoundError:
+            return None
+
+    def put(self, chunks, annotated, generator):
+        cache_file = self._cache_file(chunks)
+        cache_dir = path.dirname(cache_file)
+        makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see
+        # a partially written entry.
+        fd, tmp = mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with open(fd, mode="wb") as cache:
+                cache.write(dumps({"generator": list(generator),
+                                   "annotated": json_of_annotated(annotated)}))
+            replace(tmp, cache_file)
+        except BaseException:
+            unlink(tmp)
+            raise
 
 class DummyCache(BaseCache):
     def __init__(self, *_args):
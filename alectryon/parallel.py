@@ -0,0 +1,125 @@
+# Copyright © 2019 Clément Pit-Claudel
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Parallel processing: pools of SerAPI instances and of worker processes."""
+
+import argparse
+from collections import deque
+from functools import lru_cache
+
+# Prover pools
+# ============
+
+_PROVER_POOL = {}
+"""Running SerAPI instances, indexed by their arguments."""
+
+def annotate_pooled(chunks, sertop_args, prefix=()):
+    from .core import SerAPI
+    pool = _PROVER_POOL.setdefault(tuple(sertop_args), [])
+    try: # Not ‘if pool’: other threads may be taking provers from `pool`
+        prover = pool.pop()
+    except IndexError:
+        prover = SerAPI(args=sertop_args)
+        prover.reset()
+    try:
+        annotated = prover.annotate_reuse(chunks, prefix)
+    except BaseException:
+        prover.kill()
+        raise
+    pool.append(prover)
+    return annotated
+
+def shutdown_prover_pool():
+    for pool in _PROVER_POOL.values():
+        for prover in pool:
+            prover.kill()
+    _PROVER_POOL.clear()
+
+PROVER_WORKERS_THRESHOLD = 32
+"""Minimum number of chunks for which to use multiple SerAPI instances."""
+
+def annotate_in_parallel(chunks, sertop_args, prover_workers):
+    """Annotate `chunks` in `prover_workers` SerAPI instances.
+
+    Each instance annotates a contiguous range of `chunks`, after replaying
+    (without annotating) all the chunks that precede that range.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    n = len(chunks)
+    prover_workers = min(prover_workers, n) # Don't start idle instances
+    bounds = [n * k // prover_workers for k in range(prover_workers + 1)]
+    with ThreadPoolExecutor(max_workers=prover_workers) as executor:
+        futures = [executor.submit(annotate_pooled, chunks[start:end],
+                                   sertop_args, chunks[:start])
+                   for start, end in zip(bounds, bounds[1:])]
+        return [annotated for future in futures for annotated in future.result()]
+
+# Pipelines
+# =========
+
+def prefetching_read(read, ctxs, reader):
+    """Wrap `read` to read the input after the current one in `reader`.
+
+    Inputs are read in the order of `ctxs`.
+    """
+    def submit(ctx):
+        return reader.submit(read, None, ctx["fpath"], ctx["fname"])
+    pending, upcoming = deque([submit(ctxs[0])]), iter(ctxs[1:])
+    def prefetched_read(_, fpath, fname): # pylint: disable=unused-argument
+        ctx = next(upcoming, None)
+        if ctx is not None:
+            pending.append(submit(ctx))
+        return pending.popleft().result()
+    return prefetched_read
+
+@lru_cache(maxsize=1)
+def _init_worker(init_globals, *initargs):
+    """Initialize the current worker process (once per process)."""
+    from multiprocessing.util import Finalize
+    init_globals(*initargs)
+    # Worker processes exit without running ``atexit`` handlers, but they do
+    # run ``multiprocessing`` finalizers.
+    Finalize(None, shutdown_prover_pool, exitpriority=0)
+
+def _run_in_worker(fn, init_globals, initargs, *args):
+    # Not ``ProcessPoolExecutor(initializer=...)``: it requires Python 3.7
+    _init_worker(init_globals, *initargs)
+    return fn(*args)
+
+PARALLEL_THRESHOLD = 2
+"""Minimum number of input files for which to use multiple processes."""
+
+def process_pipelines_in_parallel(args, process_pipeline, init_globals):
+    """Call ``process_pipeline(fpath, args)`` for each input in a worker process.
+
+    `init_globals` is called once in each worker with the global options in
+    `args`.  Both functions must be picklable (defined at the top level).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    initargs = (args.debug, args.traceback,
+                args.cache_directory, args.expect_unexpected)
+    worker_args = argparse.Namespace(**{k: v for k, v in vars(args).items()
+                                        if k != "pipelines"})
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(_run_in_worker, process_pipeline, init_globals,
+                                   initargs, fpath, worker_args)
+                   for fpath, _ in args.pipelines]
+        for future in futures:
+            future.result()
@@ -29,9 +29,6 @@ from pygments.token import Error, STANDARD_TYPES, Name, Operator
 from pygments.filters import Filter, TokenMergeFilter, NameHighlightFilter
 from pygments.formatters import HtmlFormatter, LatexFormatter # pylint: disable=no-name-in-module
 
-from dominate import tags
-from dominate.util import raw as dom_raw
-
 from .pygments_lexer import CoqLexer
 from .pygments_style import TangoSubtleStyle
 
@@ -107,6 +104,8 @@ def highlight_html(coqstr):
     the implementation of ``alectryon.cli.dump_html_standalone`` to see how the
     CLI does it.
     """
+    from dominate import tags # Slow to import, and not needed for LaTeX
+    from dominate.util import raw as dom_raw
     before, highlighted, after = _highlight(coqstr, LEXER, HTML_FORMATTER)
     return tags.span(before, dom_raw(highlighted), after, cls="highlight")
 
@@ -27,6 +27,8 @@ from itertools import chain
 from .core import Text, Sentence, RichSentence, Goals, Messages
 
 class IOAnnots:
+    __slots__ = ("filters", "unfold", "fails")
+
     def __init__(self, *annots):
         self.filters = None
         self.unfold = None
@@ -74,8 +76,8 @@ class IOAnnots:
         return self.filters == self.FILTER_NONE
 
     def inherit(self, other):
-        for field, value in self.__dict__.items():
-            if value is None:
+        for field in self.__slots__:
+            if getattr(self, field) is None:
                 setattr(self, field, copy(getattr(other, field)))
 
     def __getitem__(self, key):
@@ -57,8 +57,23 @@ def latex_of_movie():
         print(ltx)
         print("</latex>")
 
+def cache_roundtrip():
+    from tempfile import TemporaryDirectory
+    from alectryon.core import GeneratorInfo
+    from alectryon.json import annotated_of_json, FileCache
+    annotated = annotated_of_json(json.loads(JS))
+    chunks = ["Goal True /\\ True. split. ", "all: eauto."]
+    with TemporaryDirectory() as cache_root:
+        doc_path = str(Path(cache_root) / "doc.v")
+        FileCache(cache_root, doc_path, {}).put(
+            chunks, annotated, GeneratorInfo("Coq+SerAPI", "8.13"))
+        cache = FileCache(cache_root, doc_path, {})
+        print(cache.generator)
+        print(cache.get(chunks) == annotated)
+
 def main():
     api_annotate()
+    cache_roundtrip()
 
 if __name__ == '__main__':
     main()